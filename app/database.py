@@ -7,167 +7,577 @@ demographics, prediction, risk percentages, specialist info, and
 triage summary.
 """
 
+import atexit
+import collections
+import contextlib
 import sqlite3
 import json
 import csv
+import functools
 import io
+import os
+import threading
+import time
 import uuid
-from datetime import datetime, timezone
 from pathlib import Path
 
 DB_PATH = Path(__file__).resolve().parent / "transcripts.db"
 
+# One long-lived connection per thread (and per process, so gunicorn
+# workers never share a handle inherited across fork).  Reusing it keeps
+# SQLite's page cache warm between requests.
+_local = threading.local()
+
+# Per-connection settings.  journal_mode=WAL is persistent in the database
+# file, so init_db() sets it once; with WAL, synchronous=NORMAL only syncs
+# at checkpoints and readers never block on a committing writer.  The
+# 256 MB mmap window lets full-table exports read pages straight from the
+# OS page cache; SQLite quietly ignores it where mmap is unsupported.
+_PRAGMAS = """
+    PRAGMA synchronous=NORMAL;
+    PRAGMA wal_autocheckpoint=1000;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+"""
+
 
 def _get_conn():
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(
+            str(DB_PATH), isolation_level=None, cached_statements=512
+        )
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_PRAGMAS)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.row_count = None
     return conn
 
 
+def _count_transcripts(conn):
+    """Row count, cached until another connection commits.
+
+    PRAGMA data_version changes whenever a different connection (the batch
+    writer thread, another gunicorn worker) modifies the database, so the
+    O(n) COUNT(*) only reruns after new data lands.  Inserts made on this
+    connection bump the cached value directly in flush_transcripts().
+    The count is its own statement, not a COUNT(*) OVER () column on the
+    page query, so list rows always have exactly the _LIST_COLUMNS shape.
+    """
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    cached = _local.row_count
+    if cached is None or cached[0] != version:
+        total = conn.execute("SELECT COUNT(*) FROM transcripts_header").fetchone()[0]
+        cached = _local.row_count = (version, total)
+    return cached[1]
+
+
+@contextlib.contextmanager
+def _tx():
+    """Write transaction on this thread's connection.
+
+    BEGIN IMMEDIATE takes the write lock up front, so contention shows up
+    at BEGIN instead of as SQLITE_BUSY halfway through a batch.  Read-only
+    paths run in autocommit and never need this.
+    """
+    conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+# Pending transcript rows, drained in batches by a background writer.
+_BATCH_SIZE = 50
+_FLUSH_INTERVAL = 1.0   # seconds
+_MAX_PENDING = 1000
+
+_pending = collections.deque()
+_pending_lock = threading.Lock()
+_flush_event = threading.Event()
+_writer = None
+
+
+# Column order of the original single-table schema (and of exports).
+_COLUMNS = (
+    "id", "session_id", "timestamp", "patient_name", "age", "sex",
+    "zip_code", "answering_for", "symptom_text", "pmh_text",
+    "selected_symptoms", "pmh", "interview_history", "prediction_level",
+    "prediction_label", "risk_pcts", "specialist_info", "reassurance",
+    "escalation", "triage_summary", "red_flag", "risk_factors",
+    "differential",
+)
+
+# Transcripts are stored as two tables sharing an id: a narrow header
+# holding what the admin list shows, and a blob table holding the large
+# free-text and JSON columns.  List pages only touch the header's pages.
+# The ``transcripts`` view joins them back into the original row shape,
+# and an INSTEAD OF trigger splits inserts across both tables.
+_HEADER_COLUMNS = (
+    "session_id", "timestamp", "patient_name", "age", "sex", "zip_code",
+    "answering_for", "symptom_text", "prediction_level", "prediction_label",
+)
+
+_BLOB_COLUMNS = (
+    "pmh_text", "selected_symptoms", "pmh", "interview_history",
+    "risk_pcts", "specialist_info", "reassurance", "escalation",
+    "triage_summary", "red_flag", "risk_factors", "differential",
+)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transcripts_header (
+        id              INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id      TEXT NOT NULL,
+        timestamp       TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        patient_name    TEXT,
+        age             INTEGER,
+        sex             TEXT,
+        zip_code        TEXT,
+        answering_for   TEXT,
+        symptom_text    TEXT,
+        prediction_level INTEGER,
+        prediction_label TEXT
+    );
+    CREATE TABLE IF NOT EXISTS transcripts_blobs (
+        id              INTEGER PRIMARY KEY REFERENCES transcripts_header (id),
+        pmh_text        TEXT,
+        selected_symptoms TEXT,
+        pmh             TEXT,
+        interview_history TEXT,
+        risk_pcts       TEXT,
+        specialist_info TEXT,
+        reassurance     TEXT,
+        escalation      TEXT,
+        triage_summary  TEXT,
+        red_flag        TEXT,
+        risk_factors    TEXT,
+        differential    TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_transcripts_header_ts_id
+        ON transcripts_header (timestamp DESC, id DESC);
+"""
+
+
+def _view_sql():
+    cols = ", ".join(
+        f"b.{c}" if c in _BLOB_COLUMNS else f"h.{c}" for c in _COLUMNS
+    )
+    header = ", ".join(_HEADER_COLUMNS)
+    header_new = ", ".join(f"NEW.{c}" for c in _HEADER_COLUMNS)
+    blobs = ", ".join(_BLOB_COLUMNS)
+    blobs_new = ", ".join(f"NEW.{c}" for c in _BLOB_COLUMNS)
+    return f"""
+        CREATE VIEW IF NOT EXISTS transcripts AS
+            SELECT {cols}
+            FROM transcripts_header h
+            LEFT JOIN transcripts_blobs b ON b.id = h.id;
+        CREATE TRIGGER IF NOT EXISTS transcripts_insert
+        INSTEAD OF INSERT ON transcripts
+        BEGIN
+            INSERT INTO transcripts_header ({header}) VALUES ({header_new});
+            INSERT INTO transcripts_blobs (id, {blobs})
+                VALUES (last_insert_rowid(), {blobs_new});
+        END;
+    """
+
+
+def _migrate_sql():
+    """Move rows out of a pre-split ``transcripts`` table, then drop it."""
+    header = ", ".join(_HEADER_COLUMNS)
+    blobs = ", ".join(_BLOB_COLUMNS)
+    return f"""
+        INSERT INTO transcripts_header (id, {header})
+            SELECT id, {header} FROM transcripts;
+        INSERT INTO transcripts_blobs (id, {blobs})
+            SELECT id, {blobs} FROM transcripts;
+        DROP TABLE transcripts;
+    """
+
+
 def init_db():
     conn = _get_conn()
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS transcripts (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id      TEXT NOT NULL,
-            timestamp       TEXT NOT NULL,
-            patient_name    TEXT,
-            age             INTEGER,
-            sex             TEXT,
-            zip_code        TEXT,
-            answering_for   TEXT,
-            symptom_text    TEXT,
-            pmh_text        TEXT,
-            selected_symptoms TEXT,
-            pmh             TEXT,
-            interview_history TEXT,
-            prediction_level INTEGER,
-            prediction_label TEXT,
-            risk_pcts       TEXT,
-            specialist_info TEXT,
-            reassurance     TEXT,
-            escalation      TEXT,
-            triage_summary  TEXT,
-            red_flag        TEXT,
-            risk_factors    TEXT,
-            differential    TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+    try:
+        _init_schema(conn)
+    finally:
+        # Under gunicorn --preload this runs in the master; closing here
+        # means no open handle is carried into the forked workers.
+        conn.close()
+        _local.conn = None
+
+
+def _init_schema(conn):
+    # journal_mode cannot change inside a transaction; the schema itself is
+    # created in one transaction so a crash never leaves it half-built.
+    conn.execute("PRAGMA journal_mode=WAL")
+    # BEGIN IMMEDIATE serializes concurrent starters (workers without
+    # --preload, scripts run beside the server), and the legacy check runs
+    # inside it so only the first one migrates.
+    with _tx():
+        legacy = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transcripts'"
+        ).fetchone()
+        # executescript() would COMMIT first and drop the lock, so the
+        # script runs statement by statement inside the transaction.
+        for stmt in _split_sql(
+            _SCHEMA + (_migrate_sql() if legacy else "") + _view_sql()
+        ):
+            conn.execute(stmt)
+
+
+def _split_sql(script):
+    """Split a SQL script into single statements; trigger bodies stay whole."""
+    buf = ""
+    for piece in script.split(";"):
+        buf += piece + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \t\n;"):
+                yield buf
+            buf = ""
+
+
+_INSERT_SQL = """
+    INSERT INTO transcripts (
+        session_id, timestamp, patient_name, age, sex, zip_code,
+        answering_for, symptom_text, pmh_text, selected_symptoms,
+        pmh, interview_history, prediction_level, prediction_label,
+        risk_pcts, specialist_info, reassurance, escalation,
+        triage_summary, red_flag, risk_factors, differential
+    ) VALUES (
+        ?, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'), ?, ?, ?, ?, ?, ?, ?, ?, ?,
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+    )
+"""
+
+
+# Compact separators keep stored rows (and every later scan of them) small.
+_JSON_DUMPS = functools.partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+
+def _uuid7():
+    """RFC 9562 UUIDv7: 48-bit Unix ms timestamp followed by random bits.
+
+    Successive ids sort in creation order, so they append to the right
+    edge of any index on session_id instead of landing at random pages.
+    """
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                          # version
+    value |= ((rand >> 62) & 0xFFF) << 64       # rand_a
+    value |= 0b10 << 62                         # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF       # rand_b
+    return uuid.UUID(int=value)
 
 
 def generate_session_id():
-    return str(uuid.uuid4())
+    return str(_uuid7())
+
+
+def _transcript_row(state, prediction, evidence):
+    return (
+        generate_session_id(),
+        state.name,
+        state.age,
+        state.sex,
+        state.zip_code,
+        state.answering_for,
+        state.symptom_text,
+        state.pmh_text,
+        _JSON_DUMPS(state.selected_symptoms),
+        _JSON_DUMPS(state.pmh),
+        _JSON_DUMPS(state.interview_history),
+        prediction.get("level"),
+        prediction.get("label"),
+        _JSON_DUMPS(evidence.get("risk_pcts", {})),
+        _JSON_DUMPS(prediction.get("specialist", {})),
+        evidence.get("reassurance", ""),
+        _JSON_DUMPS(evidence.get("escalation", [])),
+        _JSON_DUMPS(evidence.get("triage_summary", "")),
+        _JSON_DUMPS(prediction.get("red_flag")) if prediction.get("red_flag") else None,
+        _JSON_DUMPS(prediction.get("risk_factors", [])),
+        _JSON_DUMPS(evidence.get("differential", [])),
+    )
 
 
 def save_transcript(state, prediction, evidence):
-    """Save a complete encounter. Always inserts a new row."""
-    conn = _get_conn()
+    """Queue a complete encounter for saving. Always inserts a new row.
+
+    Rows are written in batches by a background thread so that one commit
+    (and one fsync) covers many sessions; a batch that fails to commit is
+    requeued and retried.  If the queue backs up past _MAX_PENDING the
+    caller flushes it synchronously and gets False if that fails.
+    """
     try:
-        conn.execute("""
-            INSERT INTO transcripts (
-                session_id, timestamp, patient_name, age, sex, zip_code,
-                answering_for, symptom_text, pmh_text, selected_symptoms,
-                pmh, interview_history, prediction_level, prediction_label,
-                risk_pcts, specialist_info, reassurance, escalation,
-                triage_summary, red_flag, risk_factors, differential
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            generate_session_id(),
-            datetime.now(timezone.utc).isoformat(),
-            state.name,
-            state.age,
-            state.sex,
-            state.zip_code,
-            state.answering_for,
-            state.symptom_text,
-            state.pmh_text,
-            json.dumps(state.selected_symptoms),
-            json.dumps(state.pmh),
-            json.dumps(state.interview_history),
-            prediction.get("level"),
-            prediction.get("label"),
-            json.dumps(evidence.get("risk_pcts", {})),
-            json.dumps(prediction.get("specialist", {})),
-            evidence.get("reassurance", ""),
-            json.dumps(evidence.get("escalation", [])),
-            json.dumps(evidence.get("triage_summary", "")),
-            json.dumps(prediction.get("red_flag")) if prediction.get("red_flag") else None,
-            json.dumps(prediction.get("risk_factors", [])),
-            json.dumps(evidence.get("differential", [])),
-        ))
-        conn.commit()
-        return True
+        row = _transcript_row(state, prediction, evidence)
     except Exception as e:
         print(f"[Transcript] Error saving: {e}")
         return False
-    finally:
-        conn.close()
+
+    global _writer
+    with _pending_lock:
+        _pending.append(row)
+        backlog = len(_pending)
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=_writer_loop, name="transcript-writer", daemon=True
+            )
+            _writer.start()
+
+    if backlog >= _MAX_PENDING:
+        if flush_transcripts() >= 0:
+            return True
+        # The database is refusing writes; withdraw this row and report
+        # failure so the caller can retry rather than count it as saved.
+        with _pending_lock:
+            try:
+                _pending.remove(row)
+            except ValueError:  # already written by a concurrent flush
+                return True
+        return False
+    if backlog >= _BATCH_SIZE:
+        _flush_event.set()
+    return True
+
+
+def flush_transcripts():
+    """Write all queued transcripts in one transaction.
+
+    Returns the number of rows written, or -1 if the batch failed.
+    """
+    with _pending_lock:
+        if not _pending:
+            return 0
+        batch = list(_pending)
+        _pending.clear()
+
+    try:
+        with _tx() as conn:
+            conn.executemany(_INSERT_SQL, batch)
+    except Exception as e:
+        # Put the batch back at the head of the queue so the writer thread
+        # retries it (e.g. after "database is locked") instead of dropping
+        # sessions whose save was already acknowledged.
+        with _pending_lock:
+            _pending.extendleft(reversed(batch))
+        print(f"[Transcript] Error saving {len(batch)} transcript(s), "
+              f"will retry: {e}")
+        return -1
+
+    if _local.row_count is not None:
+        version, total = _local.row_count
+        _local.row_count = (version, total + len(batch))
+    return len(batch)
+
+
+def _writer_loop():
+    while True:
+        _flush_event.wait(_FLUSH_INTERVAL)
+        _flush_event.clear()
+        flush_transcripts()
+
+
+atexit.register(flush_transcripts)
+
+
+# Columns shown on the admin list page, all stored in transcripts_header.
+# The large JSON columns are only read by get_transcript_by_id and the
+# exports.
+_LIST_COLUMNS = (
+    "id, session_id, timestamp, patient_name, age, sex, symptom_text, "
+    "prediction_level, prediction_label"
+)
+
+
+def count_transcripts():
+    """Number of saved transcripts (cached; see _count_transcripts)."""
+    flush_transcripts()
+    return _count_transcripts(_get_conn())
 
 
 def get_transcripts(page=1, per_page=25):
+    """Numbered page of the transcript list, newest first.
+
+    A thin wrapper over get_transcripts_after() for links that only carry
+    a page number: the preceding page's last row is located by OFFSET on
+    the (timestamp, id) index and the page itself is a keyset read.
+    Returns ``(rows, total, total_pages)``.
+    """
+    flush_transcripts()
+    conn = _get_conn()
+    total = _count_transcripts(conn)
+    total_pages = max(1, (total + per_page - 1) // per_page)
+
+    cursor = None
+    if page > 1:
+        cursor = conn.execute(
+            "SELECT timestamp, id FROM transcripts_header "
+            "ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+            ((page - 1) * per_page - 1,),
+        ).fetchone()
+        if cursor is None:  # page past the end
+            return [], total, total_pages
+    rows, _ = get_transcripts_after(cursor, per_page)
+    return rows, total, total_pages
+
+
+def get_transcripts_after(cursor=None, per_page=25):
+    """Keyset-paginated transcript list, newest first.
+
+    ``cursor`` is the ``(timestamp, id)`` of the last row on the previous
+    page, or None for the first page.  Returns ``(rows, next_cursor)``;
+    ``next_cursor`` is None when there are no more rows.
+    """
+    flush_transcripts()
     conn = _get_conn()
-    offset = (page - 1) * per_page
+    if cursor is None:
+        rows = conn.execute(
+            f"SELECT {_LIST_COLUMNS} FROM transcripts_header "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (per_page + 1,),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"SELECT {_LIST_COLUMNS} FROM transcripts_header "
+            "WHERE (timestamp, id) < (?, ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (cursor[0], cursor[1], per_page + 1),
+        ).fetchall()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, next_cursor
+
+
+def get_transcripts_before(cursor, per_page=25):
+    """The page of transcripts just newer than ``cursor``, newest first.
 
-    total = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+    ``cursor`` is the ``(timestamp, id)`` of the first row on the following
+    page.  Returns ``(rows, prev_cursor)``; ``prev_cursor`` is None when
+    there are no newer rows.
+    """
+    flush_transcripts()
+    conn = _get_conn()
     rows = conn.execute(
-        "SELECT * FROM transcripts ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-        (per_page, offset),
+        f"SELECT {_LIST_COLUMNS} FROM transcripts_header "
+        "WHERE (timestamp, id) > (?, ?) "
+        "ORDER BY timestamp ASC, id ASC LIMIT ?",
+        (cursor[0], cursor[1], per_page + 1),
     ).fetchall()
-    conn.close()
 
-    total_pages = max(1, (total + per_page - 1) // per_page)
-    return [dict(r) for r in rows], total, total_pages
+    prev_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        prev_cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+    rows.reverse()
+    return rows, prev_cursor
 
 
 def get_transcript_by_id(transcript_id):
+    """One transcript as a dict, with its JSON columns already decoded.
+
+    SQLite assembles the whole record as a single JSON object, so the
+    structured columns come back with one parse instead of one per field.
+    """
+    flush_transcripts()
     conn = _get_conn()
     row = conn.execute(
-        "SELECT * FROM transcripts WHERE id = ?", (transcript_id,)
+        f"SELECT {_json_record_sql(_DETAIL_JSON_COLUMNS)} FROM transcripts "
+        "WHERE id = ?",
+        (transcript_id,),
     ).fetchone()
-    conn.close()
     if row is None:
         return None
-    return dict(row)
+    return json.loads(row[0])
 
 
-def export_all_json():
-    conn = _get_conn()
-    rows = conn.execute(
-        "SELECT * FROM transcripts ORDER BY timestamp DESC"
-    ).fetchall()
-    conn.close()
-
-    records = []
-    for r in rows:
-        d = dict(r)
-        for key in ("selected_symptoms", "pmh", "interview_history",
-                     "risk_pcts", "specialist_info", "escalation",
-                     "red_flag", "risk_factors", "differential"):
-            if d.get(key):
-                try:
-                    d[key] = json.loads(d[key])
-                except (json.JSONDecodeError, TypeError):
-                    pass
-        records.append(d)
-    return json.dumps(records, indent=2)
-
-
-def export_all_csv():
-    conn = _get_conn()
-    rows = conn.execute(
-        "SELECT * FROM transcripts ORDER BY timestamp DESC"
-    ).fetchall()
-    conn.close()
-
-    if not rows:
-        return ""
-
-    output = io.StringIO()
-    columns = rows[0].keys()
-    writer = csv.DictWriter(output, fieldnames=columns)
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(dict(r))
-    return output.getvalue()
+_JSON_COLUMNS = (
+    "selected_symptoms", "pmh", "interview_history", "risk_pcts",
+    "specialist_info", "escalation", "red_flag", "risk_factors",
+    "differential",
+)
+
+# The detail page also renders the triage summary as a list.
+_DETAIL_JSON_COLUMNS = _JSON_COLUMNS + ("triage_summary",)
+
+
+# Rows per chunk handed to the WSGI server by the export streams.
+_EXPORT_BATCH = 200
+
+
+def _export_cursor(sql):
+    """Cursor yielding plain tuples instead of sqlite3.Row objects.
+
+    The export loops only read rows positionally, so building a Row (and
+    its name lookup table) per record is wasted work.
+    """
+    cur = _get_conn().cursor()
+    cur.row_factory = None
+    return cur.execute(sql)
+
+
+def _json_record_sql(json_columns=_JSON_COLUMNS):
+    """SELECT expression that has SQLite build each record as JSON.
+
+    JSON-typed columns go through json() so they are embedded as JSON
+    values rather than strings; anything that fails json_valid() is kept
+    as a plain string, as the old json.loads fallback did.
+    """
+    args = []
+    for col in _COLUMNS:
+        if col in json_columns:
+            expr = f"CASE WHEN json_valid({col}) THEN json({col}) ELSE {col} END"
+        else:
+            expr = col
+        args.append(f"'{col}', {expr}")
+    return "json_object(" + ", ".join(args) + ")"
+
+
+def export_all_json_stream():
+    """Yield the transcript table as a JSON array, in batches of records.
+
+    Each record is assembled by SQLite's JSON1 functions, so the stored
+    JSON columns never pass through Python's json module.
+    """
+    flush_transcripts()
+    cur = _export_cursor(
+        f"SELECT {_json_record_sql()} FROM transcripts "
+        "ORDER BY timestamp DESC, id DESC"
+    )
+
+    yield "["
+    sep = ""
+    while True:
+        rows = cur.fetchmany(_EXPORT_BATCH)
+        if not rows:
+            break
+        yield sep + ",".join([r[0] for r in rows])
+        sep = ","
+    yield "]"
+
+
+def export_all_csv_stream():
+    """Yield the transcript table as CSV text, in batches of rows."""
+    flush_transcripts()
+    cur = _export_cursor(
+        "SELECT * FROM transcripts ORDER BY timestamp DESC, id DESC"
+    )
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([c[0] for c in cur.description])
+    while True:
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        rows = cur.fetchmany(_EXPORT_BATCH)
+        if not rows:
+            break
+        writer.writerows(rows)
@@ -7,19 +7,56 @@ reference statistics from CDC NHAMCS and published literature.
 No individual patient data or dataset-specific counts are exposed.
 """
 
+import functools
+import heapq
 import json
+import re
+import sys
 from pathlib import Path
+from typing import NamedTuple
+
+from .patient_state import PMH_DIABETES, PMH_HEART_PROBLEMS
+
+try:  # orjson is optional; it parses the config files several times faster
+    import orjson
+    _loads = orjson.loads
+    _READ_MODE = "rb"
+except ImportError:
+    _loads = json.loads
+    _READ_MODE = "r"
 
 CFG_DIR = Path(__file__).resolve().parent / "config"
+_PUB_RATES_PATH = str(CFG_DIR / "public_reference_rates.json")
+_SYM_CAT_PATH = str(CFG_DIR / "symptom_categories.json")
+_DIFFERENTIALS_PATH = str(CFG_DIR / "symptom_differentials.json")
 
 _pub_rates = None
+_sym_map = None
+_by_symptom_fast = None
 
 
 def _load():
-    global _pub_rates
-    if _pub_rates is None:
-        with open(CFG_DIR / "public_reference_rates.json") as f:
-            _pub_rates = json.load(f)
+    # Tables are built in locals and published with _pub_rates last: request
+    # threads test _pub_rates, so it must never be set before the others.
+    global _pub_rates, _sym_map, _by_symptom_fast
+    if _pub_rates is not None:
+        return
+    with open(_PUB_RATES_PATH, _READ_MODE) as f:
+        pub_rates = _loads(f.read())
+    # sym_id -> (admission_rate, mortality_rate, source). Ids are
+    # interned so lookups can match on identity before comparing text.
+    by_symptom_fast = {
+        sys.intern(k): (v["admission_rate"], v["mortality_rate"],
+                        v.get("source", ""))
+        for k, v in pub_rates["by_symptom"].items() if v
+    }
+    with open(_SYM_CAT_PATH, _READ_MODE) as f:
+        sym_map = {
+            sys.intern(c["id"]): c["label"] for c in _loads(f.read())
+        }
+    _by_symptom_fast = by_symptom_fast
+    _sym_map = sym_map
+    _pub_rates = pub_rates
 
 
 def get_evidence(patient_state, prediction):
@@ -30,28 +67,44 @@ def get_evidence(patient_state, prediction):
     _load()
 
     probas = prediction.get("probabilities", {})
+    red_flag = prediction.get("red_flag")
+    specialist_info = prediction.get("specialist")
+    level = prediction.get("level", 3)
     level1_prob = probas.get(1, 0)
 
     overall = _pub_rates["overall"]
-    by_symptom = _pub_rates["by_symptom"]
+    by_symptom = _by_symptom_fast
+
+    sym_map = _sym_map
 
-    # Collect published rates for the patient's symptoms
-    matched_admission = []
-    matched_mortality = []
+    # One pass over the patient's symptoms: published rates, display
+    # name for the summary, and the per-symptom reference stats.
+    pub_admission = pub_mortality = None
     matched_sources = set()
+    primary_name = None
+    symptom_stats = []
 
     for sym_id in patient_state.selected_symptoms:
         sym_rates = by_symptom.get(sym_id)
+        label = sym_map.get(sym_id)
         if sym_rates:
-            matched_admission.append(sym_rates["admission_rate"])
-            matched_mortality.append(sym_rates["mortality_rate"])
-            matched_sources.add(sym_rates.get("source", ""))
-
-    # Use worst-case rates across matched symptoms (safety-first)
-    if matched_admission:
-        pub_admission = max(matched_admission)
-        pub_mortality = max(matched_mortality)
-    else:
+            admission, mortality, source = sym_rates
+            # Keep worst-case rates across matched symptoms (safety-first)
+            if pub_admission is None or admission > pub_admission:
+                pub_admission = admission
+            if pub_mortality is None or mortality > pub_mortality:
+                pub_mortality = mortality
+            matched_sources.add(source)
+            if label is not None:
+                symptom_stats.append({
+                    "label": label,
+                    "admission_rate": admission,
+                    "mortality_rate": mortality,
+                })
+        if primary_name is None and label is not None and sym_id != "other":
+            primary_name = label
+
+    if pub_admission is None:
         pub_admission = overall["admission_rate"]
         pub_mortality = overall["seven_day_mortality"]
 
@@ -63,28 +116,33 @@ def get_evidence(patient_state, prediction):
     # 2. Hospitalization: published admission rate for this symptom type,
     #    weighted by model confidence in Level 1. If model says high risk,
     #    use the higher of model prediction or published rate.
-    hosp_pct = round(max(pub_admission, level1_prob * pub_admission * 2), 1)
-    hosp_pct = min(hosp_pct, 95.0)
+    hosp_pct = level1_prob * pub_admission * 2
+    if hosp_pct < pub_admission:
+        hosp_pct = pub_admission
+    if hosp_pct > 95.0:
+        hosp_pct = 95.0
+    hosp_pct = round(hosp_pct, 1)
 
     # 3. Mortality: published mortality rate for this symptom type.
     death_pct = round(pub_mortality, 1)
 
-    # For red-flag overrides, ensure percentages reflect urgency
-    if prediction.get("red_flag"):
-        immediate_pct = max(immediate_pct, 95.0)
-        hosp_pct = max(hosp_pct, pub_admission)
-
     # 4. Likelihood of something serious: probability the underlying
     #    condition is not benign. Uses P(Level 1) + P(Level 2) — the
     #    chance the patient needs same-day medical care.
     p_serious = (probas.get(1, 0) + probas.get(2, 0)) * 100
-    p_serious = round(min(p_serious, 99.0), 1)
-    if prediction.get("red_flag"):
+    if p_serious > 99.0:
+        p_serious = 99.0
+    p_serious = round(p_serious, 1)
+
+    # For red-flag overrides, ensure percentages reflect urgency
+    if red_flag:
+        immediate_pct = max(immediate_pct, 95.0)
+        hosp_pct = max(hosp_pct, pub_admission)
         p_serious = max(p_serious, 95.0)
 
     result = {
         "summary": "",
-        "symptom_stats": [],
+        "symptom_stats": symptom_stats,
         "watch_for": [],
         "reassurance": "",
         "risk_pcts": {
@@ -95,19 +153,10 @@ def get_evidence(patient_state, prediction):
     }
 
     # Build summary (no patient counts — DUA compliant)
-    symptom_names = []
-    with open(CFG_DIR / "symptom_categories.json") as f:
-        sym_map = {c["id"]: c["label"] for c in json.load(f)}
-
-    for sym_id in patient_state.selected_symptoms:
-        if sym_id in sym_map and sym_id != "other":
-            symptom_names.append(sym_map[sym_id])
-
-    if symptom_names:
-        primary = symptom_names[0]
+    if primary_name:
         result["summary"] = (
             f"Based on published emergency department data, patients "
-            f"presenting with symptoms similar to yours (\"{primary}\") "
+            f"presenting with symptoms similar to yours (\"{primary_name}\") "
             f"have an estimated {hosp_pct}% rate of hospital admission."
         )
     else:
@@ -116,21 +165,10 @@ def get_evidence(patient_state, prediction):
             "against published emergency department outcome data."
         )
 
-    # Published reference info per symptom
-    for sym_id in patient_state.selected_symptoms:
-        sym_rates = by_symptom.get(sym_id)
-        if sym_rates and sym_id in sym_map:
-            result["symptom_stats"].append({
-                "label": sym_map[sym_id],
-                "admission_rate": sym_rates["admission_rate"],
-                "mortality_rate": sym_rates["mortality_rate"],
-            })
-
     # Reassurance statement + symptom-specific watch-outs
-    level = prediction.get("level", 3)
     result["reassurance"] = _build_reassurance(
-        level, symptom_names, patient_state, p_serious,
-        specialist_info=prediction.get("specialist"),
+        level, primary_name, patient_state, p_serious,
+        specialist_info=specialist_info,
     )
 
     # Watch-for signs tailored to the patient's symptoms
@@ -142,14 +180,15 @@ def get_evidence(patient_state, prediction):
     # Triage nurse summary (shown when recommendation is ER/UC/PCP)
     result["triage_summary"] = _build_triage_summary(patient_state, prediction)
 
-    # Home remedies (shown for Level 5 reassurance)
+    # Home remedies (shown for Level 5 reassurance only, so skip the work
+    # for every other level)
     result["home_remedies"] = _build_home_remedies(
         patient_state.selected_symptoms, level
-    )
+    ) if level >= 5 else []
 
-    # Specialist detail (from Arvig et al. WestJEM 2022 complaint-diagnosis map)
-    specialist_info = prediction.get("specialist")
-    if specialist_info:
+    # Specialist detail (from Arvig et al. WestJEM 2022 complaint-diagnosis map),
+    # which results.html only shows for Level 3-4
+    if specialist_info and level in (3, 4):
         result["specialist"] = specialist_info
 
     # Differential diagnosis based on symptoms, PMH, demographics
@@ -252,23 +291,12 @@ GENERAL_WATCH_FOR = [
     "Severe or worsening pain that doesn't improve",
 ]
 
+_GENERAL_WATCH_FOR = tuple(GENERAL_WATCH_FOR)
+
 
 def _build_watch_for(selected_symptoms):
     """Build a tailored watch-for list based on the patient's symptoms."""
-    signs = []
-    seen = set()
-    for sym_id in selected_symptoms:
-        for sign in SYMPTOM_WATCH_FOR.get(sym_id, []):
-            if sign not in seen:
-                signs.append(sign)
-                seen.add(sign)
-
-    for sign in GENERAL_WATCH_FOR:
-        if sign not in seen:
-            signs.append(sign)
-            seen.add(sign)
-
-    return signs[:8]
+    return list(_symptom_guidance(tuple(selected_symptoms))[0])
 
 
 # ── "If This Happens, Escalate" statements ───────────────────────────
@@ -368,39 +396,28 @@ GENERAL_ESCALATION = [
      "then_action": "See a doctor sooner than planned or go to Urgent Care", "severity": "watch"},
 ]
 
+_GENERAL_ESCALATION = tuple((esc, esc["then_action"]) for esc in GENERAL_ESCALATION)
+
 
 def _build_escalation(selected_symptoms):
     """Build a list of 'If X → Then Y' escalation statements."""
-    items = []
-    seen_actions = set()
-    for sym_id in selected_symptoms:
-        for esc in SYMPTOM_ESCALATION.get(sym_id, []):
-            key = esc["then_action"]
-            if key not in seen_actions:
-                items.append(esc)
-                seen_actions.add(key)
-
-    for esc in GENERAL_ESCALATION:
-        if esc["then_action"] not in seen_actions:
-            items.append(esc)
-            seen_actions.add(esc["then_action"])
-
-    return items[:8]
+    return [dict(esc) for esc in _symptom_guidance(tuple(selected_symptoms))[1]]
 
 
 # ── Triage nurse summary builder ─────────────────────────────────────
-CONCERNING_ANSWER_VALUES = {
+CONCERNING_ANSWER_VALUES = frozenset({
     "severe", "worst", "sudden", "thunderclap", "yes", "vomiting",
     "projectile", "pressure", "tightness", "tearing", "left_arm",
     "jaw_neck", "multiple", "one_side_face", "one_side_body",
     "loss", "double", "heart_attack", "heart_disease", "stent_surgery",
     "rapid", "yes_today", "yes_recently", "at_rest",
-}
+})
 
 
 def _build_triage_summary(patient_state, prediction):
     """Build a structured summary the patient can show the triage nurse."""
     items = []
+    items_append = items.append
 
     if patient_state.age and patient_state.sex:
         items.append(f"{patient_state.age}-year-old {patient_state.sex}")
@@ -408,11 +425,12 @@ def _build_triage_summary(patient_state, prediction):
     if patient_state.symptom_text:
         items.append(f"Came in for: {patient_state.symptom_text}")
 
+    concerning = CONCERNING_ANSWER_VALUES
     for entry in patient_state.interview_history:
-        qid = entry.get("question_id", "")
-        answer = entry.get("answer", "")
-        if "__" in qid and answer in CONCERNING_ANSWER_VALUES:
-            items.append(
+        entry_get = entry.get
+        answer = entry_get("answer", "")
+        if answer in concerning and "__" in entry_get("question_id", ""):
+            items_append(
                 f"{entry['question_text']}: {entry['answer_display']}"
             )
 
@@ -529,269 +547,196 @@ GENERAL_HOME_REMEDIES = [
     {"remedy": "Monitor your symptoms", "detail": "Keep track of how you feel. If things get worse, seek medical care."},
 ]
 
+_GENERAL_HOME_REMEDIES = tuple(GENERAL_HOME_REMEDIES)
+
 
 def _build_home_remedies(selected_symptoms, level):
     """Build a list of home remedies for reassurance-level recommendations."""
     if level > 5:
         return []
+    return [dict(rem) for rem in _symptom_guidance(tuple(selected_symptoms))[2]]
+
+
+# ── Per-symptom guidance lookup ──────────────────────────────────────
+# sym_id -> (watch-for signs, (statement, then_action) pairs,
+# (remedy, name) pairs), so each symptom is looked up once for all three
+# lists and the dedupe keys aren't re-indexed per call.
+_SYMPTOM_DATA = {
+    sym_id: (
+        tuple(dict.fromkeys(SYMPTOM_WATCH_FOR.get(sym_id, ()))),
+        tuple((esc, esc["then_action"])
+              for esc in SYMPTOM_ESCALATION.get(sym_id, ())),
+        tuple((rem, rem["remedy"])
+              for rem in SYMPTOM_HOME_REMEDIES.get(sym_id, ())),
+    )
+    for sym_id in {*SYMPTOM_WATCH_FOR, *SYMPTOM_ESCALATION, *SYMPTOM_HOME_REMEDIES}
+}
+_NO_SYMPTOM_DATA = ((), (), ())
 
-    remedies = []
-    seen = set()
-    for sym_id in selected_symptoms:
-        for rem in SYMPTOM_HOME_REMEDIES.get(sym_id, []):
-            if rem["remedy"] not in seen:
-                remedies.append(rem)
-                seen.add(rem["remedy"])
 
-    if not remedies:
-        for rem in GENERAL_HOME_REMEDIES:
-            if rem["remedy"] not in seen:
-                remedies.append(rem)
-                seen.add(rem["remedy"])
+@functools.lru_cache(maxsize=256)
+def _symptom_guidance(selected_symptoms):
+    """Watch-for signs, escalation statements and home remedies for a symptom tuple.
 
-    return remedies[:6]
+    A pure function of the ordered symptom ids (order decides which
+    duplicate wins), so results are cached per tuple. Cached entries are
+    shared by every caller, so the builders copy each dict they return.
+    """
+    # setdefault keeps the first entry per key, in first-seen order.
+    signs = {}
+    items = {}
+    remedies = {}
+    sign_add = signs.setdefault
+    item_add = items.setdefault
+    remedy_add = remedies.setdefault
+    symptom_data = _SYMPTOM_DATA.get
+    for sym_id in selected_symptoms:
+        sym_signs, sym_items, sym_remedies = symptom_data(sym_id, _NO_SYMPTOM_DATA)
+        for sign in sym_signs:
+            sign_add(sign)
+        for esc, key in sym_items:
+            item_add(key, esc)
+        for rem, key in sym_remedies:
+            remedy_add(key, rem)
+        # Later entries can only land past the cut-offs below.
+        if len(signs) >= 8 and len(items) >= 8 and len(remedies) >= 6:
+            break
+
+    signs.update(dict.fromkeys(_GENERAL_WATCH_FOR))
+    for esc, key in _GENERAL_ESCALATION:
+        item_add(key, esc)
+
+    return (
+        tuple(signs)[:8],
+        tuple(items.values())[:8],
+        # The general remedies are only a fallback, and already unique.
+        tuple(remedies.values())[:6] if remedies else _GENERAL_HOME_REMEDIES[:6],
+    )
 
 
 # ── Reassurance statement builder ────────────────────────────────────
-def _build_reassurance(level, symptom_names, patient_state, p_serious,
+# Paragraph bodies are fixed text with a few named slots, filled with
+# str.format_map so only the substitutions vary per call.
+_REASSURANCE_ER = (
+    "We understand that {symptom} can be frightening. "
+    "Based on your responses, this combination of symptoms warrants "
+    "prompt medical evaluation to rule out anything serious. "
+    "Many patients who go to the emergency department for similar "
+    "symptoms are treated and sent home the same day. Going to the "
+    "ER is the safe and right thing to do \u2014 it does not mean the "
+    "worst is happening. Getting checked out gives you and your "
+    "doctors the information needed to take care of you properly."
+)
+
+_REASSURANCE_UC = (
+    "Your symptoms suggest you should be seen by a healthcare "
+    "provider today, but the situation is unlikely to be "
+    "life-threatening. An urgent care center can evaluate you, "
+    "run basic tests, and provide treatment or refer you if needed. "
+    "Most people with similar symptoms are treated and feel better "
+    "within a short time. If at any point your symptoms get "
+    "significantly worse, go to the nearest emergency department."
+)
+
+_REASSURANCE_PCP_REFERRAL = (
+    "Based on what you've told us, your symptoms are worth "
+    "getting checked, but they don't appear to need emergency "
+    "care right now. We recommend making an appointment with "
+    "your primary care doctor in the next day or two. Your "
+    "doctor can do a thorough evaluation and, if needed, refer "
+    "you to a {specialist} for further workup. Most conditions "
+    "like this can be effectively managed starting with your "
+    "primary care provider. In the meantime, rest, stay "
+    "hydrated, and monitor how you're feeling."
+)
+
+_REASSURANCE_PCP = (
+    "Based on what you've told us, your symptoms are concerning "
+    "enough to see a doctor, but they don't appear to need "
+    "emergency care right now. We recommend making an appointment "
+    "with your primary care doctor in the next day or two. "
+    "Your doctor can do a thorough evaluation and order any tests "
+    "that might be helpful. In the meantime, rest, stay hydrated, "
+    "and monitor how you're feeling."
+)
+
+# The specialist paragraph is joined from fixed fragments around the two
+# parts that vary.
+_SPECIALIST_PREFIX = (
+    "Your symptoms suggest a condition that may benefit from "
+    "specialized care. Based on published data from large emergency "
+    "department studies, patients with similar complaints most often "
+    "receive a diagnosis managed by "
+)
+_SPECIALIST_MIDDLE = (
+    ". This is not an emergency, but a specialist can help you get the "
+    "right diagnosis and treatment plan."
+)
+_SPECIALIST_SUFFIX = (
+    " Ask your primary care doctor for a referral, or contact the "
+    "specialist's office directly. Most conditions like this respond well "
+    "to treatment once properly identified."
+)
+_SECONDARY_PREFIX = " In some cases, a "
+_SECONDARY_SUFFIX = (
+    " may also be helpful, and your doctor can advise which is best for you."
+)
+
+_REASSURANCE_SELF_CARE = (
+    "The good news is that based on your responses, your symptoms "
+    "are very likely not serious. Many people experience similar "
+    "symptoms that resolve on their own with rest, hydration, and "
+    "over-the-counter remedies. That said, your body knows best "
+    "\u2014 if something feels wrong or your symptoms change, don't "
+    "hesitate to seek medical care. Trust your instincts."
+)
+
+
+def _build_reassurance(level, primary_name, patient_state, p_serious,
                        specialist_info=None):
     """Generate a warm, personalized reassurance paragraph."""
-    symptom_desc = symptom_names[0] if symptom_names else "your symptoms"
-    age = patient_state.age or "unknown"
+    symptom_desc = primary_name or "your symptoms"
 
     if level == 1:
-        return (
-            f"We understand that {symptom_desc.lower()} can be frightening. "
-            f"Based on your responses, this combination of symptoms warrants "
-            f"prompt medical evaluation to rule out anything serious. "
-            f"Many patients who go to the emergency department for similar "
-            f"symptoms are treated and sent home the same day. Going to the "
-            f"ER is the safe and right thing to do \u2014 it does not mean the "
-            f"worst is happening. Getting checked out gives you and your "
-            f"doctors the information needed to take care of you properly."
-        )
+        return _REASSURANCE_ER.format_map({"symptom": symptom_desc.lower()})
     elif level == 2:
-        return (
-            f"Your symptoms suggest you should be seen by a healthcare "
-            f"provider today, but the situation is unlikely to be "
-            f"life-threatening. An urgent care center can evaluate you, "
-            f"run basic tests, and provide treatment or refer you if needed. "
-            f"Most people with similar symptoms are treated and feel better "
-            f"within a short time. If at any point your symptoms get "
-            f"significantly worse, go to the nearest emergency department."
-        )
+        return _REASSURANCE_UC
     elif level == 3:
         sp_info = specialist_info or {}
         if sp_info.get("pcp_first") and sp_info.get("specialist"):
-            sp_name = sp_info["specialist"]
-            return (
-                f"Based on what you've told us, your symptoms are worth "
-                f"getting checked, but they don't appear to need emergency "
-                f"care right now. We recommend making an appointment with "
-                f"your primary care doctor in the next day or two. Your "
-                f"doctor can do a thorough evaluation and, if needed, refer "
-                f"you to a {sp_name} for further workup. Most conditions "
-                f"like this can be effectively managed starting with your "
-                f"primary care provider. In the meantime, rest, stay "
-                f"hydrated, and monitor how you're feeling."
+            return _REASSURANCE_PCP_REFERRAL.format_map(
+                {"specialist": sp_info["specialist"]}
             )
-        return (
-            f"Based on what you've told us, your symptoms are concerning "
-            f"enough to see a doctor, but they don't appear to need "
-            f"emergency care right now. We recommend making an appointment "
-            f"with your primary care doctor in the next day or two. "
-            f"Your doctor can do a thorough evaluation and order any tests "
-            f"that might be helpful. In the meantime, rest, stay hydrated, "
-            f"and monitor how you're feeling."
-        )
+        return _REASSURANCE_PCP
     elif level == 4:
         sp_name = (specialist_info or {}).get("specialist", "a specialist")
         sp_secondary = (specialist_info or {}).get("secondary")
         sp_line = f"a {sp_name}" if sp_name else "a specialist"
         secondary_line = ""
         if sp_secondary:
-            secondary_line = (
-                f" In some cases, a {sp_secondary} may also be helpful, "
-                f"and your doctor can advise which is best for you."
+            secondary_line = "".join(
+                (_SECONDARY_PREFIX, str(sp_secondary), _SECONDARY_SUFFIX)
             )
-        return (
-            f"Your symptoms suggest a condition that may benefit from "
-            f"specialized care. Based on published data from large emergency "
-            f"department studies, patients with similar complaints most often "
-            f"receive a diagnosis managed by {sp_line}. This is not an "
-            f"emergency, but a specialist can help you get the right "
-            f"diagnosis and treatment plan.{secondary_line} Ask your primary "
-            f"care doctor for a referral, or contact the specialist's "
-            f"office directly. Most conditions like this respond well to "
-            f"treatment once properly identified."
-        )
+        return "".join((
+            _SPECIALIST_PREFIX, sp_line, _SPECIALIST_MIDDLE,
+            secondary_line, _SPECIALIST_SUFFIX,
+        ))
     else:
-        return (
-            f"The good news is that based on your responses, your symptoms "
-            f"are very likely not serious. Many people experience similar "
-            f"symptoms that resolve on their own with rest, hydration, and "
-            f"over-the-counter remedies. That said, your body knows best "
-            f"\u2014 if something feels wrong or your symptoms change, don't "
-            f"hesitate to seek medical care. Trust your instincts."
-        )
+        return _REASSURANCE_SELF_CARE
 
 
 # ── Differential Diagnosis Builder ────────────────────────────────────
 # Maps symptoms to specific plain-language diagnoses with approximate
 # likelihood based on Arvig et al. WestJEM 2022 discharge diagnosis data
-# and standard clinical teaching.
+# and standard clinical teaching. The table lives in
+# config/symptom_differentials.json and is loaded on first use.
 
-SYMPTOM_DIFFERENTIALS = {
-    "chest_pain": [
-        {"diagnosis": "Musculoskeletal chest wall pain", "likelihood": "Common", "notes": "Reproducible with palpation; often positional"},
-        {"diagnosis": "Gastroesophageal reflux (GERD)", "likelihood": "Common", "notes": "Burning quality; worse after eating or lying down"},
-        {"diagnosis": "Anxiety / Panic attack", "likelihood": "Common", "notes": "Palpitations, tingling, sense of doom; often in younger patients"},
-        {"diagnosis": "Acute coronary syndrome (heart attack)", "likelihood": "Less common", "notes": "Pressure/squeezing; radiates to arm/jaw; sweating; risk increases with age, diabetes, smoking"},
-        {"diagnosis": "Pulmonary embolism", "likelihood": "Less common", "notes": "Sudden onset with shortness of breath; pleuritic; risk with immobility, birth control, recent surgery"},
-        {"diagnosis": "Pneumonia / Pleuritis", "likelihood": "Less common", "notes": "Sharp pain with breathing; cough; fever"},
-        {"diagnosis": "Pericarditis", "likelihood": "Uncommon", "notes": "Sharp pain worse with lying flat, better leaning forward; recent viral illness"},
-        {"diagnosis": "Aortic dissection", "likelihood": "Rare", "notes": "Tearing pain radiating to back; hypertension; medical emergency"},
-    ],
-    "shortness_of_breath": [
-        {"diagnosis": "Asthma / Reactive airway", "likelihood": "Common", "notes": "Wheezing; triggered by allergens, exercise, or cold air"},
-        {"diagnosis": "COPD exacerbation", "likelihood": "Common", "notes": "Chronic smoker; worsening baseline dyspnea; productive cough"},
-        {"diagnosis": "Pneumonia", "likelihood": "Common", "notes": "Cough, fever, abnormal breath sounds"},
-        {"diagnosis": "Heart failure exacerbation", "likelihood": "Less common", "notes": "Leg swelling, orthopnea, history of heart disease"},
-        {"diagnosis": "Anxiety / Hyperventilation", "likelihood": "Common", "notes": "Tingling, lightheadedness; often younger patients"},
-        {"diagnosis": "Pulmonary embolism", "likelihood": "Less common", "notes": "Sudden onset; pleuritic chest pain; tachycardia"},
-        {"diagnosis": "Anemia", "likelihood": "Less common", "notes": "Gradual onset; fatigue; pallor"},
-    ],
-    "headache": [
-        {"diagnosis": "Tension headache", "likelihood": "Very common", "notes": "Band-like pressure; bilateral; associated with stress"},
-        {"diagnosis": "Migraine", "likelihood": "Common", "notes": "Unilateral, throbbing; nausea; light/sound sensitivity; aura possible"},
-        {"diagnosis": "Sinusitis", "likelihood": "Common", "notes": "Facial pressure; nasal congestion; worse leaning forward"},
-        {"diagnosis": "Medication overuse headache", "likelihood": "Less common", "notes": "Chronic daily headache in someone using analgesics >15 days/month"},
-        {"diagnosis": "Hypertensive headache", "likelihood": "Less common", "notes": "Severe headache with very high blood pressure"},
-        {"diagnosis": "Subarachnoid hemorrhage", "likelihood": "Rare", "notes": "Sudden thunderclap worst-ever headache; medical emergency"},
-        {"diagnosis": "Meningitis", "likelihood": "Rare", "notes": "Headache with fever, stiff neck, photophobia"},
-        {"diagnosis": "Intracranial mass", "likelihood": "Rare", "notes": "Progressive headache; worse in morning; neurologic deficits"},
-    ],
-    "abdominal_pain": [
-        {"diagnosis": "Gastritis / Dyspepsia", "likelihood": "Very common", "notes": "Epigastric burning; related to meals, NSAID use, or stress"},
-        {"diagnosis": "Gastroenteritis", "likelihood": "Common", "notes": "Crampy pain with nausea, vomiting, or diarrhea; often viral"},
-        {"diagnosis": "Constipation", "likelihood": "Common", "notes": "Diffuse cramping; infrequent or hard stools"},
-        {"diagnosis": "Urinary tract infection", "likelihood": "Common", "notes": "Lower abdominal pain with urinary frequency, burning"},
-        {"diagnosis": "Appendicitis", "likelihood": "Less common", "notes": "Starts around navel, migrates to right lower quadrant; fever"},
-        {"diagnosis": "Cholecystitis (gallbladder)", "likelihood": "Less common", "notes": "Right upper quadrant pain after fatty meals; nausea"},
-        {"diagnosis": "Kidney stones", "likelihood": "Less common", "notes": "Severe flank pain radiating to groin; comes in waves"},
-        {"diagnosis": "Small bowel obstruction", "likelihood": "Uncommon", "notes": "Crampy pain, vomiting, distension; history of prior surgery"},
-        {"diagnosis": "Ectopic pregnancy", "likelihood": "Uncommon", "notes": "Lower abdominal pain in reproductive-age female; missed period"},
-    ],
-    "fever": [
-        {"diagnosis": "Viral upper respiratory infection", "likelihood": "Very common", "notes": "Cough, congestion, sore throat; self-limited"},
-        {"diagnosis": "Urinary tract infection", "likelihood": "Common", "notes": "Fever with urinary symptoms; flank pain if pyelonephritis"},
-        {"diagnosis": "Influenza", "likelihood": "Common", "notes": "High fever, body aches, fatigue; seasonal"},
-        {"diagnosis": "Pneumonia", "likelihood": "Less common", "notes": "Fever with productive cough, shortness of breath"},
-        {"diagnosis": "Cellulitis / Skin infection", "likelihood": "Less common", "notes": "Fever with localized redness, swelling, warmth"},
-        {"diagnosis": "COVID-19", "likelihood": "Less common", "notes": "Fever with cough, loss of taste/smell, fatigue"},
-        {"diagnosis": "Sepsis", "likelihood": "Uncommon", "notes": "High fever with confusion, rapid breathing, tachycardia; emergency"},
-    ],
-    "dizziness": [
-        {"diagnosis": "Benign positional vertigo (BPPV)", "likelihood": "Very common", "notes": "Brief spinning triggered by head position changes"},
-        {"diagnosis": "Orthostatic hypotension", "likelihood": "Common", "notes": "Lightheadedness on standing; dehydration or medication side effect"},
-        {"diagnosis": "Vestibular neuritis / Labyrinthitis", "likelihood": "Common", "notes": "Prolonged vertigo after viral illness; may have hearing changes"},
-        {"diagnosis": "Anemia", "likelihood": "Less common", "notes": "Gradual onset; fatigue, pallor, shortness of breath"},
-        {"diagnosis": "Cardiac arrhythmia", "likelihood": "Less common", "notes": "Intermittent lightheadedness with palpitations"},
-        {"diagnosis": "Stroke / TIA", "likelihood": "Uncommon", "notes": "Dizziness with focal weakness, speech difficulty, vision changes; emergency"},
-    ],
-    "back_pain": [
-        {"diagnosis": "Muscle strain / Mechanical back pain", "likelihood": "Very common", "notes": "Related to lifting, activity, or posture; improves with rest"},
-        {"diagnosis": "Degenerative disc disease", "likelihood": "Common", "notes": "Chronic; worsens with activity; common in older adults"},
-        {"diagnosis": "Herniated disc / Sciatica", "likelihood": "Less common", "notes": "Pain radiating down the leg; numbness or tingling"},
-        {"diagnosis": "Spinal stenosis", "likelihood": "Less common", "notes": "Pain with walking, relieved by sitting; older adults"},
-        {"diagnosis": "Kidney stones / Pyelonephritis", "likelihood": "Less common", "notes": "Flank pain; may have urinary symptoms or fever"},
-        {"diagnosis": "Vertebral compression fracture", "likelihood": "Uncommon", "notes": "Sudden pain after minor trauma; osteoporosis risk"},
-        {"diagnosis": "Cauda equina syndrome", "likelihood": "Rare", "notes": "Saddle numbness, bladder/bowel changes, bilateral leg weakness; emergency"},
-    ],
-    "nausea_vomiting": [
-        {"diagnosis": "Gastroenteritis (stomach bug)", "likelihood": "Very common", "notes": "Viral or food-related; diarrhea often accompanies"},
-        {"diagnosis": "Food poisoning", "likelihood": "Common", "notes": "Acute onset hours after eating; shared with others who ate same food"},
-        {"diagnosis": "Medication side effect", "likelihood": "Common", "notes": "New medication or change in dosage"},
-        {"diagnosis": "Gastritis / Peptic ulcer", "likelihood": "Less common", "notes": "Epigastric pain; NSAID or alcohol use"},
-        {"diagnosis": "Pregnancy", "likelihood": "Less common", "notes": "Morning nausea in reproductive-age female; missed period"},
-        {"diagnosis": "Bowel obstruction", "likelihood": "Uncommon", "notes": "Severe vomiting with abdominal distension and no bowel movements"},
-        {"diagnosis": "Pancreatitis", "likelihood": "Uncommon", "notes": "Severe epigastric pain radiating to back; alcohol or gallstone history"},
-    ],
-    "sore_throat": [
-        {"diagnosis": "Viral pharyngitis", "likelihood": "Very common", "notes": "Cough, congestion, runny nose; gradual onset"},
-        {"diagnosis": "Streptococcal pharyngitis (strep)", "likelihood": "Common", "notes": "Sudden onset; fever, swollen tonsils, no cough; rapid test available"},
-        {"diagnosis": "Infectious mononucleosis", "likelihood": "Less common", "notes": "Fatigue, swollen lymph nodes, possible splenomegaly; young adults"},
-        {"diagnosis": "Peritonsillar abscess", "likelihood": "Uncommon", "notes": "Severe unilateral pain, trismus, muffled voice; requires drainage"},
-    ],
-    "cough": [
-        {"diagnosis": "Viral upper respiratory infection", "likelihood": "Very common", "notes": "Self-limited; congestion, sore throat"},
-        {"diagnosis": "Acute bronchitis", "likelihood": "Common", "notes": "Persistent cough 1-3 weeks; may produce sputum"},
-        {"diagnosis": "Asthma", "likelihood": "Common", "notes": "Cough worse at night or with exercise; wheezing"},
-        {"diagnosis": "Post-nasal drip", "likelihood": "Common", "notes": "Throat clearing; sensation of drainage; allergies or sinusitis"},
-        {"diagnosis": "Pneumonia", "likelihood": "Less common", "notes": "Cough with fever, shortness of breath, and abnormal breath sounds"},
-        {"diagnosis": "GERD-related cough", "likelihood": "Less common", "notes": "Chronic cough; heartburn; worse lying down"},
-    ],
-    "rash": [
-        {"diagnosis": "Contact dermatitis", "likelihood": "Common", "notes": "Itchy rash after exposure to irritant or allergen"},
-        {"diagnosis": "Eczema (atopic dermatitis)", "likelihood": "Common", "notes": "Dry, itchy patches; often in skin folds; chronic/recurring"},
-        {"diagnosis": "Urticaria (hives)", "likelihood": "Common", "notes": "Raised, itchy welts; allergic trigger; comes and goes"},
-        {"diagnosis": "Cellulitis", "likelihood": "Less common", "notes": "Expanding redness, warmth, pain; may have fever; bacterial infection"},
-        {"diagnosis": "Shingles (herpes zoster)", "likelihood": "Less common", "notes": "Painful, blistering rash in a band/stripe; one side only"},
-        {"diagnosis": "Drug reaction", "likelihood": "Less common", "notes": "Rash after starting new medication"},
-    ],
-    "urinary": [
-        {"diagnosis": "Urinary tract infection (UTI)", "likelihood": "Very common", "notes": "Burning, frequency, urgency; more common in women"},
-        {"diagnosis": "Kidney stones", "likelihood": "Less common", "notes": "Severe flank pain with blood in urine"},
-        {"diagnosis": "Pyelonephritis (kidney infection)", "likelihood": "Less common", "notes": "UTI symptoms plus fever, flank pain, nausea"},
-        {"diagnosis": "Benign prostatic hyperplasia", "likelihood": "Less common", "notes": "Weak stream, frequency, nocturia; older males"},
-        {"diagnosis": "Sexually transmitted infection", "likelihood": "Less common", "notes": "Dysuria with discharge; recent sexual exposure"},
-    ],
-    "extremity_pain": [
-        {"diagnosis": "Musculoskeletal strain / Sprain", "likelihood": "Very common", "notes": "Related to activity or injury; localized pain and swelling"},
-        {"diagnosis": "Osteoarthritis", "likelihood": "Common", "notes": "Joint pain worse with use; stiffness in morning; older adults"},
-        {"diagnosis": "Tendinitis / Bursitis", "likelihood": "Common", "notes": "Pain around a joint with repetitive use"},
-        {"diagnosis": "Gout", "likelihood": "Less common", "notes": "Sudden severe joint pain (often big toe); redness, swelling"},
-        {"diagnosis": "Fracture", "likelihood": "Less common", "notes": "Pain after trauma; swelling, deformity, inability to bear weight"},
-        {"diagnosis": "Deep vein thrombosis (DVT)", "likelihood": "Uncommon", "notes": "Calf pain and swelling; risk with immobility, travel, birth control"},
-    ],
-    "swelling": [
-        {"diagnosis": "Dependent edema", "likelihood": "Common", "notes": "Ankle/leg swelling worse at end of day; improves with elevation"},
-        {"diagnosis": "Venous insufficiency", "likelihood": "Common", "notes": "Chronic leg swelling with skin changes; varicose veins"},
-        {"diagnosis": "Heart failure", "likelihood": "Less common", "notes": "Bilateral leg swelling with shortness of breath; cardiac history"},
-        {"diagnosis": "Deep vein thrombosis", "likelihood": "Less common", "notes": "Unilateral leg swelling with calf pain; acute onset"},
-        {"diagnosis": "Cellulitis", "likelihood": "Less common", "notes": "Swelling with redness, warmth, and pain; may have fever"},
-    ],
-    "eye_problem": [
-        {"diagnosis": "Conjunctivitis (pink eye)", "likelihood": "Common", "notes": "Red eye with discharge; itching (allergic) or crusting (infectious)"},
-        {"diagnosis": "Dry eye syndrome", "likelihood": "Common", "notes": "Gritty sensation; burning; worse with screen use"},
-        {"diagnosis": "Corneal abrasion", "likelihood": "Less common", "notes": "Sharp pain, tearing, light sensitivity after trauma or contact lens"},
-        {"diagnosis": "Migraine with visual aura", "likelihood": "Less common", "notes": "Visual changes (zigzag lines, spots) followed by headache"},
-        {"diagnosis": "Acute glaucoma", "likelihood": "Rare", "notes": "Severe eye pain, blurred vision, halos; nausea; emergency"},
-        {"diagnosis": "Retinal detachment", "likelihood": "Rare", "notes": "Flashes, floaters, curtain over vision; emergency"},
-    ],
-    "injury_fall": [
-        {"diagnosis": "Soft tissue contusion / Bruise", "likelihood": "Very common", "notes": "Pain and bruising at impact site; no fracture"},
-        {"diagnosis": "Fracture", "likelihood": "Common", "notes": "Severe pain, swelling, deformity; inability to bear weight or use limb"},
-        {"diagnosis": "Sprain / Ligament injury", "likelihood": "Common", "notes": "Joint pain and instability; swelling around joint"},
-        {"diagnosis": "Concussion", "likelihood": "Less common", "notes": "Head injury with headache, dizziness, confusion; may have brief LOC"},
-        {"diagnosis": "Intracranial hemorrhage", "likelihood": "Rare", "notes": "Head injury with worsening headache, vomiting, altered consciousness; emergency"},
-    ],
-    "fracture": [
-        {"diagnosis": "Simple fracture", "likelihood": "Common", "notes": "Localized pain, swelling, deformity after trauma"},
-        {"diagnosis": "Stress fracture", "likelihood": "Less common", "notes": "Gradual onset pain with repetitive activity; common in runners"},
-        {"diagnosis": "Pathologic fracture", "likelihood": "Uncommon", "notes": "Fracture from minimal trauma; may indicate osteoporosis or underlying disease"},
-    ],
-    "pelvic_pain": [
-        {"diagnosis": "Menstrual cramps (dysmenorrhea)", "likelihood": "Common", "notes": "Cyclic lower abdominal pain; related to period"},
-        {"diagnosis": "Urinary tract infection", "likelihood": "Common", "notes": "Suprapubic pain with urinary symptoms"},
-        {"diagnosis": "Ovarian cyst", "likelihood": "Less common", "notes": "Unilateral pelvic pain; may be sudden if ruptured"},
-        {"diagnosis": "Pelvic inflammatory disease", "likelihood": "Less common", "notes": "Lower abdominal pain, discharge, fever; sexually active females"},
-        {"diagnosis": "Ectopic pregnancy", "likelihood": "Uncommon", "notes": "Pelvic pain with missed period; vaginal bleeding; emergency if ruptured"},
-        {"diagnosis": "Kidney stones", "likelihood": "Less common", "notes": "Flank-to-groin pain; hematuria; comes in waves"},
-    ],
-}
 
-LIKELIHOOD_ORDER = {"Very common": 1, "Common": 2, "Less common": 3, "Uncommon": 4, "Rare": 5}
+# Likelihood labels by rank; a higher rank is more likely. Entries carry
+# the int rank and only turn back into a label on the way out.
+_RANK_LABELS = ("Rare", "Uncommon", "Less common", "Common", "Very common")
+_LIKELIHOOD_RANK = {label: rank for rank, label in enumerate(_RANK_LABELS)}
+_TOP_RANK = len(_RANK_LABELS) - 1
 
 
 _SERIOUS_MARKERS = {
@@ -802,70 +747,224 @@ _SERIOUS_MARKERS = {
     "fracture", "concussion", "appendicitis", "cholecystitis",
     "pyelonephritis", "pancreatitis", "heart failure",
 }
-
-
-def _acuity_score(dx, level):
+_SERIOUS_RE = re.compile("|".join(map(re.escape, sorted(_SERIOUS_MARKERS))))
+
+
+# Modifier bits, set from phrases in a diagnosis's notes.
+_OLDER_ADULTS = 1        # demoted for patients under 40
+_YOUNGER_PATIENTS = 2    # demoted for patients 60 and over
+_FEMALE_ONLY = 4         # dropped for male patients
+_MALE_ONLY = 8           # dropped for female patients
+_DIABETES = 16           # promoted with a diabetes history
+_CARDIAC = 32            # promoted with a heart-problem history
+_OSTEOPOROSIS = 64       # promoted for patients 65 and over
+
+# Each diagnosis matches at most one of the rank-changing phrases; the
+# differential relies on that when it nets promotions against demotions.
+_NOTE_FLAGS = (
+    ("older adults", _OLDER_ADULTS),
+    ("younger patients", _YOUNGER_PATIENTS),
+    ("reproductive-age female", _FEMALE_ONLY),
+    ("older males", _MALE_ONLY),
+    ("diabetes", _DIABETES),
+    ("cardiac", _CARDIAC),
+    ("osteoporosis", _OSTEOPOROSIS),
+)
+
+
+def _acuity_score(is_serious, level):
     """Lower score = more relevant to the recommendation level.
 
     For ER/UC-level recommendations, serious diagnoses that need to be ruled
     out are the ones *driving* the recommendation, so they rank first.
     For lower-acuity levels, common benign diagnoses rank first.
     """
+    return 0 if (level <= 2) == is_serious else 2
+
+
+class _DxEntry(NamedTuple):
+    """A differential entry with its notes scanned once at load."""
+    dx: dict
+    diagnosis: str      # interned; the dedupe key across symptoms
+    rank: int
+    flags: int
+    is_serious: bool
+    acuity_low: int     # _acuity_score for levels 1-2
+    acuity_high: int    # _acuity_score for levels 3-5
+
+
+def _compile_dx(dx):
+    notes = dx["notes"].lower()
     text = (dx["diagnosis"] + " " + dx["notes"]).lower()
-    is_serious = any(m in text for m in _SERIOUS_MARKERS)
+    flags = 0
+    for phrase, bit in _NOTE_FLAGS:
+        if phrase in notes:
+            flags |= bit
+    is_serious = _SERIOUS_RE.search(text) is not None
+    return _DxEntry(
+        dx=dx,
+        diagnosis=sys.intern(dx["diagnosis"]),
+        rank=_LIKELIHOOD_RANK.get(dx["likelihood"], 2),
+        flags=flags,
+        is_serious=is_serious,
+        acuity_low=_acuity_score(is_serious, 1),
+        acuity_high=_acuity_score(is_serious, 3),
+    )
+
+
+def _dx_lanes(recs, drop):
+    recs = tuple(r for r in recs if not r.flags & drop)
+    return recs, tuple(r.rank for r in recs), tuple(r.flags for r in recs)
+
+
+_NO_LANES = ((), (), ())
+
+
+# Selection keys over (record, rank, source symptom) candidates, for levels
+# 1-2 and 3-5.
+def _dx_key_low(d):
+    return d[0].acuity_low, -d[1]
+
+
+def _dx_key_high(d):
+    return d[0].acuity_high, -d[1]
 
-    if level <= 2:
-        return 0 if is_serious else 2
-    return 2 if is_serious else 0
+
+_dx_lanes_by_sex = None
+_dx_top_plain = None
+
+
+def _load_differentials():
+    """Parse the differential table and build its lookup tables once."""
+    global _dx_lanes_by_sex, _dx_top_plain
+    if _dx_lanes_by_sex is not None:
+        return
+    with open(_DIFFERENTIALS_PATH, _READ_MODE) as f:
+        differentials = _loads(f.read())["differentials"]
+    records = {
+        sym_id: tuple(_compile_dx(dx) for dx in dxs)
+        for sym_id, dxs in differentials.items()
+    }
+
+    # sex -> sym_id -> (records, ranks, flags): parallel tuples, so the
+    # differential loop reads the two int lanes it tests and touches records
+    # only to keep them. Sex-specific diagnoses are filtered out per table up
+    # front; any other sex value uses the unfiltered "unknown" table.
+    lanes_by_sex = {
+        sex: {sym_id: _dx_lanes(recs, drop) for sym_id, recs in records.items()}
+        for sex, drop in (("male", _FEMALE_ONLY), ("female", _MALE_ONLY),
+                          ("unknown", 0))
+    }
+
+    # sex -> (levels 1-2, levels 3-5) -> sym_id -> top 3 candidates with
+    # their unmodified ranks: the whole answer for a single symptom when no
+    # age or history modifier applies.
+    _dx_top_plain = {
+        sex: tuple(
+            {
+                sym_id: tuple(heapq.nsmallest(
+                    3, [(rec, rec.rank, sym_id) for rec in lanes[0]], key=key
+                ))
+                for sym_id, lanes in table.items()
+            }
+            for key in (_dx_key_low, _dx_key_high)
+        )
+        for sex, table in lanes_by_sex.items()
+    }
+    _dx_lanes_by_sex = lanes_by_sex
+
+
+def preload():
+    """Load the reference rates and differential tables now."""
+    _load()
+    _load_differentials()
 
 
 def _build_differential(selected_symptoms, patient_state, level):
     """Return the top 3 diagnoses most likely driving the recommendation."""
-    differentials = []
-    seen_dx = set()
-
+    _load_differentials()
+    # Cached entries are shared by every caller; hand out copies.
+    return [dict(entry) for entry in _differential_cached(
+        tuple(selected_symptoms),
+        patient_state.age or 40,
+        patient_state.sex or "unknown",
+        patient_state.pmh_flags,
+        level,
+    )]
+
+
+# Pure in its (hashable) inputs, so cached like _symptom_guidance. Symptom
+# order is part of the key since the first symptom listing a diagnosis
+# becomes its source_symptom.
+@functools.lru_cache(maxsize=4096)
+def _differential_cached(selected_symptoms, age, sex, pmh_flags, level):
+    # The patient's side of every modifier, as masks over the record flags.
+    promote_mask = demote_mask = 0
+    if age < 40:
+        demote_mask |= _OLDER_ADULTS
+    if age >= 60:
+        demote_mask |= _YOUNGER_PATIENTS
+    if age >= 65:
+        promote_mask |= _OSTEOPOROSIS
+    if pmh_flags & PMH_DIABETES:
+        promote_mask |= _DIABETES
+    if pmh_flags & PMH_HEART_PROBLEMS:
+        promote_mask |= _CARDIAC
+
+    if sex not in _dx_lanes_by_sex:
+        sex = "unknown"
+
+    if len(selected_symptoms) == 1 and not (promote_mask | demote_mask):
+        plain = _dx_top_plain[sex][level > 2]
+        return _differential_entries(plain.get(selected_symptoms[0], ()))
+
+    # diagnosis -> (record, rank, source symptom). A diagnosis listed under
+    # several symptoms keeps its highest-ranked version; ties keep the
+    # first symptom that listed it.
+    best = {}
+    # Entries no active modifier touches (every entry, for a patient with
+    # none) keep their stored rank untouched.
+    active = promote_mask | demote_mask
+    lanes = _dx_lanes_by_sex[sex].get
     for sym_id in selected_symptoms:
-        for dx in SYMPTOM_DIFFERENTIALS.get(sym_id, []):
-            if dx["diagnosis"] not in seen_dx:
-                entry = dict(dx)
-                entry["source_symptom"] = sym_id
-
-                age = patient_state.age or 40
-                sex = patient_state.sex or "unknown"
-                pmh = set(patient_state.pmh) if patient_state.pmh else set()
-
-                if "older adults" in dx["notes"].lower() and age < 40:
-                    entry["likelihood"] = _demote(dx["likelihood"])
-                if "younger patients" in dx["notes"].lower() and age >= 60:
-                    entry["likelihood"] = _demote(dx["likelihood"])
-                if "reproductive-age female" in dx["notes"].lower() and sex == "male":
-                    continue
-                if "older males" in dx["notes"].lower() and sex == "female":
-                    continue
-                if "diabetes" in dx["notes"].lower() and "Diabetes" in pmh:
-                    entry["likelihood"] = _promote(dx["likelihood"])
-                if "cardiac" in dx["notes"].lower() and "Heart Problems" in pmh:
-                    entry["likelihood"] = _promote(dx["likelihood"])
-                if "osteoporosis" in dx["notes"].lower() and age >= 65:
-                    entry["likelihood"] = _promote(dx["likelihood"])
-
-                differentials.append(entry)
-                seen_dx.add(dx["diagnosis"])
-
-    differentials.sort(key=lambda d: (
-        _acuity_score(d, level),
-        LIKELIHOOD_ORDER.get(d["likelihood"], 3),
-    ))
-    return differentials[:3]
-
-
-def _promote(likelihood):
-    order = ["Rare", "Uncommon", "Less common", "Common", "Very common"]
-    idx = order.index(likelihood) if likelihood in order else 2
-    return order[min(idx + 1, len(order) - 1)]
-
-
-def _demote(likelihood):
-    order = ["Rare", "Uncommon", "Less common", "Common", "Very common"]
-    idx = order.index(likelihood) if likelihood in order else 2
-    return order[max(idx - 1, 0)]
+        recs, ranks, flag_lane = lanes(sym_id, _NO_LANES)
+        for rec, rank, flags in zip(recs, ranks, flag_lane):
+            if flags & active:
+                # No entry carries more than one rank modifier (see
+                # _NOTE_FLAGS), so the net shift is -1 or +1.
+                shift = ((flags & promote_mask).bit_count()
+                         - (flags & demote_mask).bit_count())
+                if shift > 0:
+                    rank = _promote(rank)
+                elif shift < 0:
+                    rank = _demote(rank)
+
+            prev = best.get(rec.diagnosis)
+            if prev is None or rank > prev[1]:
+                best[rec.diagnosis] = (rec, rank, sym_id)
+
+    # Only the top 3 are kept, so a bounded heap beats a full sort; nsmallest
+    # is stable, matching sorted(...)[:3] on ties, and falls back to sorted()
+    # itself when there are 3 candidates or fewer.
+    key = _dx_key_low if level <= 2 else _dx_key_high
+    return _differential_entries(heapq.nsmallest(3, best.values(), key=key))
+
+
+def _differential_entries(top):
+    """Output dicts for the selected (record, rank, source symptom) triples."""
+    result = []
+    for rec, rank, sym_id in top:
+        entry = dict(rec.dx)
+        entry["source_symptom"] = sym_id
+        if rank != rec.rank:
+            entry["likelihood"] = _RANK_LABELS[rank]
+        result.append(entry)
+    return tuple(result)
+
+
+def _promote(rank):
+    return rank + 1 if rank < _TOP_RANK else _TOP_RANK
+
+
+def _demote(rank):
+    return rank - 1 if rank > 0 else 0
@@ -9,6 +9,7 @@ The engine decides what question to ask next based on the patient's
 current state (symptoms selected, answers given, PMH, demographics).
 """
 
+import functools
 import json
 from pathlib import Path
 from typing import Optional
@@ -38,21 +39,32 @@ class InterviewEngine:
 
     def check_red_flags(self, patient_state) -> Optional[dict]:
         """Return a red-flag rule dict if triggered, else None."""
-        with open(CFG_DIR / "red_flags.json") as f:
-            rules = json.load(f)
-
         features = patient_state.to_feature_dict()
+        age = patient_state.age
 
-        for rule in rules:
-            conditions = rule.get("conditions", {})
-            all_met = all(features.get(k, 0) >= v for k, v in conditions.items())
-            if "age_min" in rule and patient_state.age is not None:
-                all_met = all_met and patient_state.age >= rule["age_min"]
-            if all_met and conditions:
+        for conditions, age_min, rule in _red_flag_rules():
+            if age_min is not None and age is not None and age < age_min:
+                continue
+            if all(features.get(k, 0) >= v for k, v in conditions):
                 return rule
         return None
 
 
+@functools.lru_cache(maxsize=None)
+def _red_flag_rules():
+    """Red-flag rules from config as (conditions, age_min, rule), in file order.
+
+    Rules without conditions can never fire and are dropped here.
+    """
+    with open(CFG_DIR / "red_flags.json") as f:
+        rules = json.load(f)
+    return tuple(
+        (tuple(rule["conditions"].items()), rule.get("age_min"), rule)
+        for rule in rules
+        if rule.get("conditions")
+    )
+
+
 class TreeInterviewEngine(InterviewEngine):
     """
     Structured clinical question trees — zero API cost, deterministic,
@@ -64,6 +76,14 @@ class TreeInterviewEngine(InterviewEngine):
         self._trees = {}
         self._baseline_questions = self._build_baseline_questions()
         self._load_trees()
+        # Both lookups are pure functions of the state key, and the engine
+        # lives for the whole process, so cache per instance.
+        self._next_question_cached = functools.lru_cache(maxsize=4096)(
+            self._next_question
+        )
+        self._estimate_total_cached = functools.lru_cache(maxsize=1024)(
+            self._estimate_total
+        )
 
     def _load_trees(self):
         if not TREE_DIR.exists():
@@ -152,14 +172,30 @@ class TreeInterviewEngine(InterviewEngine):
         ]
 
     def get_next_question(self, patient_state) -> Optional[Question]:
-        answered_ids = {h["question_id"] for h in patient_state.interview_history}
+        # Only follow-up answers feed tree conditions, so baseline answers
+        # (name, age, ...) stay out of the key and patients share entries.
+        followup_answers = tuple(
+            (qid, tuple(ans) if isinstance(ans, list) else ans)
+            for qid, ans in patient_state.interview_answers.items()
+            if "__" in qid
+        )
+        return self._next_question_cached(
+            tuple(h["question_id"] for h in patient_state.interview_history),
+            patient_state.answering_for,
+            tuple(patient_state.selected_symptoms),
+            followup_answers,
+        )
+
+    def _next_question(self, history_ids, answering_for, selected_symptoms,
+                       followup_answers) -> Optional[Question]:
+        answered_ids = set(history_ids)
 
         # Phase 1: baseline questions
-        is_proxy = patient_state.answering_for and patient_state.answering_for != "self"
+        is_proxy = answering_for and answering_for != "self"
         for q in self._baseline_questions:
             if q.id not in answered_ids:
                 if q.id == "answering_for_reason":
-                    if patient_state.answering_for == "self":
+                    if answering_for == "self":
                         continue
                 if is_proxy and q.id == "age":
                     return Question(
@@ -189,14 +225,15 @@ class TreeInterviewEngine(InterviewEngine):
                 return q
 
         # Phase 2: symptom-specific follow-up questions (capped)
-        followup_count = sum(1 for h in patient_state.interview_history if "__" in h["question_id"])
+        followup_count = sum(1 for qid in history_ids if "__" in qid)
         if followup_count >= MAX_FOLLOWUPS:
             return None
 
         generic_tree = self._trees.get("_generic")
         used_generic = False
 
-        for symptom_id in patient_state.selected_symptoms:
+        answers = dict(followup_answers)
+        for symptom_id in selected_symptoms:
             tree = self._trees.get(symptom_id)
             if not tree:
                 if generic_tree and not used_generic:
@@ -215,7 +252,7 @@ class TreeInterviewEngine(InterviewEngine):
                 condition = node.get("condition")
                 if condition:
                     dep_qid = f"{symptom_id}__{condition['question_id']}"
-                    dep_answer = patient_state.interview_answers.get(dep_qid)
+                    dep_answer = answers.get(dep_qid)
                     if dep_answer not in condition.get("values", []):
                         continue
 
@@ -234,11 +271,14 @@ class TreeInterviewEngine(InterviewEngine):
 
     def estimate_total(self, patient_state):
         """Rough estimate of total questions for progress display."""
+        return self._estimate_total_cached(tuple(patient_state.selected_symptoms))
+
+    def _estimate_total(self, selected_symptoms):
         total = len(self._baseline_questions)
         followup_est = 0
         generic_tree = self._trees.get("_generic")
         used_generic = False
-        for sym_id in patient_state.selected_symptoms:
+        for sym_id in selected_symptoms:
             tree = self._trees.get(sym_id)
             if not tree and generic_tree and not used_generic:
                 tree = generic_tree
@@ -122,6 +122,12 @@ def _load():
             _feature_cols = json.load(f)
 
 
+def preload():
+    """Load the model and lookup tables now instead of on first use."""
+    _load()
+    _load_specialist_map()
+
+
 def predict(patient_state):
     """
     Run the triage model on the patient state.
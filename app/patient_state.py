@@ -300,6 +300,13 @@ def parse_pmh_text(text):
     return matched
 
 
+# History categories that change downstream ranking, as bit flags
+# (see PatientState.pmh_flags).
+PMH_DIABETES = 1
+PMH_HEART_PROBLEMS = 2
+_PMH_FLAG_BITS = {"Diabetes": PMH_DIABETES, "Heart Problems": PMH_HEART_PROBLEMS}
+
+
 class PatientState:
     """Tracks all information gathered during the triage interview."""
 
@@ -362,6 +369,14 @@ class PatientState:
         """Parse free-text PMH input into PMH category IDs."""
         self.pmh = parse_pmh_text(self.pmh_text)
 
+    @property
+    def pmh_flags(self):
+        """PMH_* bits for the history categories present in pmh."""
+        flags = 0
+        for cat in self.pmh or ():
+            flags |= _PMH_FLAG_BITS.get(cat, 0)
+        return flags
+
     # ── Feature vector for model prediction ──────────────────────────
     def to_feature_dict(self):
         """Convert current state to a dict matching model feature columns."""
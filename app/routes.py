@@ -7,66 +7,101 @@ Manages the interview flow: welcome → baseline → follow-ups → results.
 
 from flask import (
     Flask, render_template, request, session, redirect, url_for, jsonify,
-    Response, make_response,
+    Response, make_response, stream_with_context,
 )
 from functools import wraps
 from .patient_state import PatientState
 from .interview_engine import TreeInterviewEngine
 from .model import predict
 from .evidence import get_evidence
-from . import database
-import json, os
+from . import database, evidence, model
+import hashlib, os
 
 app = Flask(__name__,
             template_folder=os.path.join(os.path.dirname(__file__), "templates"),
             static_folder=os.path.join(os.path.dirname(__file__), "static"))
 app.secret_key = os.environ.get("SECRET_KEY", "triage-app-dev-key-change-in-prod")
 
+# With REDIS_URL set, interview state lives server-side and the cookie
+# only carries a session ID; otherwise Flask's signed cookie is used.
+if os.environ.get("REDIS_URL"):
+    import redis
+    from flask_session import Session
+
+    app.config.update(
+        SESSION_TYPE="redis",
+        SESSION_REDIS=redis.Redis.from_url(os.environ["REDIS_URL"]),
+        SESSION_SERIALIZATION_FORMAT="msgpack",
+    )
+    Session(app)
+
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "triage-admin-2026")
+_ADMIN_PER_PAGE = 25
+
+# Baseline questions that must all be answered before red flags other than
+# altered mental status are checked.
+_BASELINE_IDS = frozenset({"name", "answering_for", "age", "sex",
+                           "symptoms", "pmh", "zip_code"})
 
 engine = TreeInterviewEngine()
 database.init_db()
 
+# Load the model, evidence tables and compiled templates now.  Under
+# gunicorn --preload this runs once in the master, and the workers share
+# them copy-on-write instead of each loading its own on first request.
+model.preload()
+evidence.preload()
+for _name in app.jinja_env.list_templates(extensions=["html"]):
+    app.jinja_env.get_template(_name)
+
+# Content hash of the templates behind /interview.  It is mixed into the
+# page's ETag so a deploy that changes the markup invalidates pages
+# browsers have cached; every worker computes the same value.
+_INTERVIEW_TEMPLATE_VERSION = hashlib.blake2b(
+    "".join(
+        app.jinja_env.loader.get_source(app.jinja_env, _name)[0]
+        for _name in ("base.html", "interview.html")
+    ).encode(),
+    digest_size=8,
+).hexdigest()
+
+
+# (PatientState attribute, session key) pairs persisted between requests.
+_STATE_FIELDS = (
+    ("name", "name"),
+    ("answering_for", "answering_for"),
+    ("age", "age"),
+    ("sex", "sex"),
+    ("zip_code", "zip_code"),
+    ("symptom_text", "symptom_text"),
+    ("pmh_text", "pmh_text"),
+    ("selected_body_regions", "body_regions"),
+    ("selected_symptoms", "symptoms"),
+    ("pmh", "pmh"),
+    ("interview_answers", "answers"),
+    ("interview_history", "history"),
+    ("red_flag_triggered", "red_flag"),
+    ("phase", "phase"),
+)
+
 
 def _get_state() -> PatientState:
-    """Restore PatientState from session."""
+    """Restore PatientState from session.
+
+    Keys missing from the session keep PatientState's own defaults.
+    """
     state = PatientState()
-    data = session.get("patient", {})
-    state.name = data.get("name")
-    state.answering_for = data.get("answering_for")
-    state.age = data.get("age")
-    state.sex = data.get("sex")
-    state.zip_code = data.get("zip_code")
-    state.symptom_text = data.get("symptom_text", "")
-    state.pmh_text = data.get("pmh_text", "")
-    state.selected_body_regions = data.get("body_regions", [])
-    state.selected_symptoms = data.get("symptoms", [])
-    state.pmh = data.get("pmh", [])
-    state.interview_answers = data.get("answers", {})
-    state.interview_history = data.get("history", [])
-    state.red_flag_triggered = data.get("red_flag")
-    state.phase = data.get("phase", "welcome")
+    data = session.get("patient")
+    if data:
+        for attr, key in _STATE_FIELDS:
+            if key in data:
+                setattr(state, attr, data[key])
     return state
 
 
 def _save_state(state: PatientState):
     """Persist PatientState to session."""
-    session["patient"] = {
-        "name": state.name,
-        "answering_for": state.answering_for,
-        "age": state.age,
-        "sex": state.sex,
-        "zip_code": state.zip_code,
-        "symptom_text": state.symptom_text,
-        "pmh_text": state.pmh_text,
-        "body_regions": state.selected_body_regions,
-        "symptoms": state.selected_symptoms,
-        "pmh": state.pmh,
-        "answers": state.interview_answers,
-        "history": state.interview_history,
-        "red_flag": state.red_flag_triggered,
-        "phase": state.phase,
-    }
+    session["patient"] = {key: getattr(state, attr) for attr, key in _STATE_FIELDS}
 
 
 @app.route("/")
@@ -95,13 +130,107 @@ def interview():
     if question is None:
         return redirect(url_for("results"))
 
-    return render_template(
-        "interview.html",
-        question=question,
-        progress=len(state.interview_history) + 1,
-        total=engine.estimate_total(state),
-        patient_name=state.name or "",
-    )
+    progress = len(state.interview_history) + 1
+    total = engine.estimate_total(state)
+    patient_name = state.name or ""
+
+    # The page is fully determined by these values and the template
+    # version, so a revalidating browser (refresh, back button) gets a 304
+    # without a re-render.
+    etag = hashlib.blake2b(
+        f"{_INTERVIEW_TEMPLATE_VERSION}|{question.id}|{question.text}|"
+        f"{progress}|{total}|{patient_name}".encode(),
+        digest_size=8,
+    ).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = make_response(render_template(
+            "interview.html",
+            question=question,
+            progress=progress,
+            total=total,
+            patient_name=patient_name,
+        ))
+    resp.set_etag(etag, weak=True)
+    resp.headers["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return resp
+
+
+# Baseline answer handlers, keyed by question id.  Each updates the state
+# from the raw answer and returns True if the answer ends the interview.
+
+def _answer_name(state, raw):
+    if not isinstance(raw, str):
+        state.name = ""
+        return
+    name = raw.strip()
+    # Already-cased ASCII names ("Jane Doe") are left as typed; istitle()
+    # only implies title() is a no-op for ASCII (not for e.g. "ß").
+    state.name = name if name.isascii() and name.istitle() else name.title()
+
+
+def _answer_answering_for(state, raw):
+    state.answering_for = raw
+
+
+def _answer_answering_for_reason(state, raw):
+    state.answering_for = raw
+    if raw == "confused":
+        state.red_flag_triggered = {
+            "id": "mental_status_confused",
+            "name": "Confusion / Altered Mental Status",
+            "message": (
+                "If the person you\u2019re helping is confused and unable "
+                "to answer questions, this may indicate a serious condition "
+                "such as a stroke, severe infection, or other emergency. "
+                "Please call 911 or go to the nearest Emergency Department "
+                "right away."
+            ),
+            "override_level": 1,
+        }
+        return True
+    # chronic_unable: patient has a pre-existing condition that prevents
+    # them from answering (e.g., nonverbal, paralyzed). This is NOT an
+    # emergency by itself — continue the interview normally and let the
+    # decision tree / model determine the appropriate care level.
+
+
+def _answer_age(state, raw):
+    try:
+        state.age = int(raw)
+    except (ValueError, TypeError):
+        state.age = 40
+
+
+def _answer_sex(state, raw):
+    state.sex = raw
+
+
+def _answer_symptoms(state, raw):
+    state.symptom_text = raw if isinstance(raw, str) else " ".join(raw)
+    state.parse_symptoms_from_text()
+
+
+def _answer_pmh(state, raw):
+    state.pmh_text = raw if isinstance(raw, str) else " ".join(raw)
+    state.parse_pmh_from_text()
+
+
+def _answer_zip_code(state, raw):
+    state.zip_code = raw.strip() if isinstance(raw, str) else None
+
+
+_ANSWER_HANDLERS = {
+    "name": _answer_name,
+    "answering_for": _answer_answering_for,
+    "answering_for_reason": _answer_answering_for_reason,
+    "age": _answer_age,
+    "sex": _answer_sex,
+    "symptoms": _answer_symptoms,
+    "pmh": _answer_pmh,
+    "zip_code": _answer_zip_code,
+}
 
 
 @app.route("/answer", methods=["POST"])
@@ -109,21 +238,19 @@ def answer():
     """Process an answer and advance the interview."""
     state = _get_state()
 
-    qid = request.form.get("question_id", "")
-    qtype = request.form.get("question_type", "")
-    qtext = request.form.get("question_text", "")
+    form = request.form
+    qid = form.get("question_id", "")
+    qtype = form.get("question_type", "")
+    qtext = form.get("question_text", "")
 
     if qtype == "multi_choice":
-        raw = request.form.getlist("answer")
+        raw = form.getlist("answer")
+        answer_display = ", ".join(form.getlist("answer_label") or raw)
     else:
-        raw = request.form.get("answer", "")
+        raw = form.get("answer", "")
+        answer_display = raw
 
     state.interview_answers[qid] = raw
-    answer_display = raw if isinstance(raw, str) else ", ".join(raw)
-
-    if isinstance(raw, list):
-        labels = request.form.getlist("answer_label")
-        answer_display = ", ".join(labels) if labels else ", ".join(raw)
 
     state.interview_history.append({
         "question_id": qid,
@@ -133,64 +260,28 @@ def answer():
     })
 
     # Update state from baseline answers
-    if qid == "name":
-        state.name = raw.strip().title() if isinstance(raw, str) else ""
-    elif qid == "answering_for":
-        state.answering_for = raw
-    elif qid == "answering_for_reason":
-        state.answering_for = raw
-        if raw == "confused":
-            state.red_flag_triggered = {
-                "id": "mental_status_confused",
-                "name": "Confusion / Altered Mental Status",
-                "message": (
-                    "If the person you\u2019re helping is confused and unable "
-                    "to answer questions, this may indicate a serious condition "
-                    "such as a stroke, severe infection, or other emergency. "
-                    "Please call 911 or go to the nearest Emergency Department "
-                    "right away."
-                ),
-                "override_level": 1,
-            }
-            _save_state(state)
-            return redirect(url_for("results"))
-        # chronic_unable: patient has a pre-existing condition that prevents
-        # them from answering (e.g., nonverbal, paralyzed). This is NOT an
-        # emergency by itself — continue the interview normally and let the
-        # decision tree / model determine the appropriate care level.
-    elif qid == "age":
-        try:
-            state.age = int(raw)
-        except (ValueError, TypeError):
-            state.age = 40
-    elif qid == "sex":
-        state.sex = raw
-    elif qid == "symptoms":
-        state.symptom_text = raw if isinstance(raw, str) else " ".join(raw)
-        state.parse_symptoms_from_text()
-    elif qid == "pmh":
-        state.pmh_text = raw if isinstance(raw, str) else " ".join(raw)
-        state.parse_pmh_from_text()
-    elif qid == "zip_code":
-        state.zip_code = raw.strip() if isinstance(raw, str) else None
+    handler = _ANSWER_HANDLERS.get(qid)
+    ends_interview = handler is not None and handler(state, raw)
 
-    # Red flag check: mental status flags fire immediately (handled above).
+    # Red flag check: mental status flags fire immediately (see
+    # _answer_answering_for_reason).
     # All other red flags fire after baseline intake is complete so we collect
     # PMH and zip code for the triage-nurse summary and facility finder.
-    BASELINE_IDS = {"name", "answering_for", "age", "sex",
-                    "symptoms", "pmh", "zip_code"}
-    answered_ids = {h["question_id"] for h in state.interview_history}
-    baseline_complete = BASELINE_IDS.issubset(answered_ids)
+    # Completion follows the history, as the engine does.  When a
+    # resubmitted question is undone with /back, its earlier entry stays
+    # (the engine won't ask it again) but its answer is gone.
+    baseline_complete = _BASELINE_IDS.issubset(
+        h["question_id"] for h in state.interview_history
+    )
 
-    if baseline_complete or "__" in qid:
+    if not ends_interview and (baseline_complete or "__" in qid):
         red_flag = engine.check_red_flags(state)
         if red_flag:
             state.red_flag_triggered = red_flag
-            _save_state(state)
-            return redirect(url_for("results"))
+            ends_interview = True
 
     _save_state(state)
-    return redirect(url_for("interview"))
+    return redirect(url_for("results" if ends_interview else "interview"))
 
 
 @app.route("/back", methods=["POST"])
@@ -288,50 +379,90 @@ def admin_logout():
 @app.route("/admin/transcripts")
 @admin_required
 def admin_list():
-    page = request.args.get("page", 1, type=int)
-    transcripts, total, total_pages = database.get_transcripts(page=page)
+    """Transcript list, paged by (timestamp, id) keyset cursors.
+
+    Previous/Next links carry the cursor of the edge row on the current
+    page; a bare ``?page=N`` (bookmarks, old links) falls back to the
+    numbered-page wrapper.  ``page`` is only the label shown.
+    """
+    page = max(request.args.get("page", 1, type=int), 1)
+    after = _parse_cursor(request.args.get("after"))
+    before = _parse_cursor(request.args.get("before"))
+    total = database.count_transcripts()
+    total_pages = max(1, (total + _ADMIN_PER_PAGE - 1) // _ADMIN_PER_PAGE)
+
+    if before is not None:
+        transcripts, prev_cursor = database.get_transcripts_before(
+            before, _ADMIN_PER_PAGE)
+        has_prev, has_next = prev_cursor is not None, True
+        if not has_prev:
+            page = 1
+    elif after is not None:
+        transcripts, next_cursor = database.get_transcripts_after(
+            after, _ADMIN_PER_PAGE)
+        has_prev, has_next = True, next_cursor is not None
+    else:
+        transcripts, _, _ = database.get_transcripts(page, _ADMIN_PER_PAGE)
+        has_prev, has_next = page > 1, page < total_pages
+
+    prev_url = next_url = None
+    if transcripts:
+        if has_prev:
+            prev_url = url_for("admin_list", page=page - 1,
+                               before=_format_cursor(transcripts[0]))
+        if has_next:
+            next_url = url_for("admin_list", page=page + 1,
+                               after=_format_cursor(transcripts[-1]))
     return render_template(
         "admin_list.html",
         transcripts=transcripts,
         page=page,
         total=total,
         total_pages=total_pages,
+        prev_url=prev_url,
+        next_url=next_url,
     )
 
 
+def _parse_cursor(value):
+    """Decode a ``timestamp,id`` list cursor from the query string."""
+    if not value:
+        return None
+    timestamp, _, transcript_id = value.rpartition(",")
+    try:
+        return timestamp, int(transcript_id)
+    except ValueError:
+        return None
+
+
+def _format_cursor(row):
+    return f"{row['timestamp']},{row['id']}"
+
+
 @app.route("/admin/transcripts/<int:transcript_id>")
 @admin_required
 def admin_detail(transcript_id):
     t = database.get_transcript_by_id(transcript_id)
     if t is None:
         return "Transcript not found", 404
-    for key in ("selected_symptoms", "pmh", "interview_history",
-                "risk_pcts", "specialist_info", "escalation",
-                "triage_summary", "red_flag", "risk_factors",
-                "differential"):
-        if t.get(key):
-            try:
-                t[key] = json.loads(t[key])
-            except (json.JSONDecodeError, TypeError):
-                pass
     return render_template("admin_detail.html", t=t)
 
 
 @app.route("/admin/export/csv")
 @admin_required
 def admin_export_csv():
-    csv_data = database.export_all_csv()
-    resp = make_response(csv_data)
-    resp.headers["Content-Type"] = "text/csv"
-    resp.headers["Content-Disposition"] = "attachment; filename=transcripts.csv"
-    return resp
+    return Response(
+        stream_with_context(database.export_all_csv_stream()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=transcripts.csv"},
+    )
 
 
 @app.route("/admin/export/json")
 @admin_required
 def admin_export_json():
-    json_data = database.export_all_json()
-    resp = make_response(json_data)
-    resp.headers["Content-Type"] = "application/json"
-    resp.headers["Content-Disposition"] = "attachment; filename=transcripts.json"
-    return resp
+    return Response(
+        stream_with_context(database.export_all_json_stream()),
+        mimetype="application/json",
+        headers={"Content-Disposition": "attachment; filename=transcripts.json"},
+    )
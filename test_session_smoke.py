@@ -0,0 +1,73 @@
+"""
+Smoke test for the cookie-backed session flow.
+Drives the app through Flask's test client (no running server needed):
+baseline answers -> results page -> admin login and transcript list.
+"""
+
+import tempfile
+
+from app import database
+
+database.DB_PATH = database.Path(tempfile.mkdtemp()) / "smoke.db"
+
+from app.routes import app, ADMIN_PASSWORD  # noqa: E402
+
+BASELINE = [
+    ("name", "text", "jane doe"),
+    ("answering_for", "single_choice", "self"),
+    ("age", "number", "67"),
+    ("sex", "single_choice", "male"),
+    ("symptoms", "text", "chest pain and shortness of breath"),
+    ("pmh", "text", "diabetes"),
+    ("zip_code", "text", "10001"),
+]
+
+
+def _answer(client, qid, qtype, answer):
+    return client.post("/answer", data={
+        "question_id": qid,
+        "question_type": qtype,
+        "question_text": qid,
+        "answer": answer,
+    })
+
+
+def test_answer_and_results_round_trip():
+    client = app.test_client()
+    assert client.post("/start").status_code == 302
+
+    for qid, qtype, answer in BASELINE:
+        resp = _answer(client, qid, qtype, answer)
+        assert resp.status_code == 302, f"/answer {qid}: {resp.status_code}"
+
+    # Chest pain + shortness of breath is a red flag once baseline is done.
+    assert resp.headers["Location"].endswith("/results")
+    resp = client.get("/results")
+    assert resp.status_code == 200
+    assert b"Jane Doe" in resp.data
+
+    resp = client.post("/admin", data={"password": ADMIN_PASSWORD})
+    assert resp.headers["Location"].endswith("/admin/transcripts")
+    resp = client.get("/admin/transcripts")
+    assert resp.status_code == 200
+    assert b"Jane Doe" in resp.data
+
+
+def test_resubmitted_baseline_question_still_checks_red_flags():
+    # Back button + resubmit posts "name" twice; /back then undoes only the
+    # second entry.  The interview must still treat baseline as complete.
+    client = app.test_client()
+    client.post("/start")
+    _answer(client, *BASELINE[0])
+    _answer(client, *BASELINE[0])
+    client.post("/back")
+
+    for qid, qtype, answer in BASELINE[1:]:
+        resp = _answer(client, qid, qtype, answer)
+    assert resp.headers["Location"].endswith("/results")
+
+
+if __name__ == "__main__":
+    test_answer_and_results_round_trip()
+    test_resubmitted_baseline_question_still_checks_red_flags()
+    print("✓ session smoke test passed")